@@ -11,6 +11,7 @@ import abc
 import copy
 import errno
 import glob
+import hashlib
 import io
 import math
 import os
@@ -26,6 +27,7 @@ from typing import List
 from typing import Tuple
 from typing import Dict
 import importlib.util
+import itertools
 
 import pexpect
 import fnmatch
@@ -193,6 +195,71 @@ class ArmedAtEndOfTestException(ErrorException):
     pass
 
 
+# regular expressions used when parsing the C++ code for log message
+# definitions; compiled once as they are applied to every line of
+# every source file we scan
+_RE_COMMENT = re.compile("//.*")
+_RE_DEFINE = re.compile(r'^#define (\w+_(?:LABELS|FMT|UNITS|MULTS))[ \t]+(".*")', re.MULTILINE)
+# a (possibly backslash-continued) macro in a LogStructure.h file
+# defining log structures:
+_RE_STRUCTURE_MACRO = re.compile(
+    r"^#define (?:LOG_COMMON_STRUCTURES|LOG_STRUCTURE_FROM_\w*|LOG_RTC_MESSAGE\w*)((?:.*\\[ \t]*\n)*.*)",
+    re.MULTILINE)
+_RE_LINE_CONTINUATION = re.compile(r"\\[ \t]*\n")
+_RE_STRUCTURE_ENTRY = re.compile(r"{([^{}]*)}")
+_RE_LOG_MSG = re.compile(r'\s*LOG_\w+\s*,\s*(?:sizeof|RLOG_SIZE)\([^)]+\)\s*,\s*"(\w+)"\s*,\s*"(\w+)"\s*,\s*"([\w,]+)"\s*,\s*"([^"]+)"\s*,\s*"([^"]+)"\s*(,\s*(true|false))?\s*$')  # noqa
+_RE_OPEN_BRACE = re.compile(r"\s*{(.*)},\s*")
+_RE_OPEN_BRACE_PARTIAL = re.compile(r"\s*{(.*)")
+_RE_CLOSE_BRACE = re.compile("(.*)}")
+_RE_STRUCTURE_END = re.compile("};")
+_RE_STR_CONCAT = re.compile(r'"\s*"')
+_RE_TRAIL_BACKSLASH = re.compile(r"\\$")
+_RE_STATEMENT_END = re.compile(r".*\);")
+_RE_LOGGER_WRITE_ANY = re.compile(r"logger(?:\(\))?[.]Write")
+_RE_AP_LOGGER_WRITE_START = re.compile(r"\s*AP::logger\(\)[.]Write(?:Streaming)?\(")
+_RE_LOGGER_WRITE_START = re.compile(r"\s*logger[.]Write(?:Streaming)?\(")
+_RE_LOGGER_WRITE = re.compile(r'logger[.]Write(?:Streaming)?\(\s*"(\w+)"\s*,\s*"([\w,]+)".*\);')
+_RE_AP_LOGGER_WRITE = re.compile(r'AP::logger\(\)[.]Write(?:Streaming)?\(\s*"(\w+)"\s*,\s*"([\w,]+)".*\);')
+# lines within a vehicle's Log.cpp structure block which are not
+# structure entries:
+_RE_LOG_CPP_SKIP = re.compile("|".join(map(re.escape, (
+    "#if HAL_QUADPLANE_ENABLED",
+    "#if FRAME_CONFIG == HELI_FRAME",
+    "#if AC_PRECLAND_ENABLED",
+    "#if AP_PLANE_OFFBOARD_GUIDED_SLEW_ENABLED",
+    "#end",
+    "LOG_COMMON_STRUCTURES",
+))))
+
+# directories never worth descending into when scanning for log definitions
+_SCAN_SKIP_DIRS = frozenset([".git", "build", "modules"])
+
+
+def _scan_files(root, want, skip_dirs=_SCAN_SKIP_DIRS, follow_symlinks=False):
+    '''yield paths of all files beneath root for which want(entry) is
+    true, without descending into skip_dirs'''
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=follow_symlinks):
+                    if entry.name in skip_dirs:
+                        continue
+                    stack.append(entry.path)
+                elif want(entry):
+                    yield entry.path
+
+
+def _scan_cpp(root):
+    '''yield paths of C++ source files beneath root which may contain
+    logger.Write calls'''
+    for path in _scan_files(root, lambda entry: entry.name.endswith(".cpp")):
+        if "AP_Logger/examples" in path:
+            # this is the sample file which contains examples...
+            continue
+        yield path
+
+
 class Context(object):
     def __init__(self):
         self.parameters = []
@@ -2649,20 +2716,6 @@ class TestSuite(abc.ABC):
 #        if fail:
 #            raise NotAchievedException("Extra parameters in XML")
 
-    def find_format_defines(self, lines):
-        ret = {}
-        for line in lines:
-            if isinstance(line, bytes):
-                line = line.decode("utf-8")
-            m = re.match(r'#define (\w+_(?:LABELS|FMT|UNITS|MULTS))\s+(".*")', line)
-            if m is None:
-                continue
-            (a, b) = (m.group(1), m.group(2))
-            if a in ret:
-                raise NotAchievedException("Duplicate define for (%s)" % a)
-            ret[a] = b
-        return ret
-
     def vehicle_code_dirpath(self):
         '''returns path to vehicle-specific code directory e.g. ~/ardupilot/Rover'''
         dirname = self.log_name()
@@ -2674,200 +2727,169 @@ class TestSuite(abc.ABC):
 
     def find_LogStructureFiles(self):
         '''return list of files named LogStructure.h'''
+        names = frozenset(['LogStructure.h', 'LogStructure_SBP.h'])
+        return list(_scan_files(self.rootdir(), lambda entry: entry.name in names))
+
+    def find_log_write_statements(self, filepath):
+        '''return a list of the logger.Write statements in the C++ file at
+        filepath'''
         ret = []
-        for root, _, files in os.walk(self.rootdir()):
-            for f in files:
-                if f == 'LogStructure.h':
-                    ret.append(os.path.join(root, f))
-                if f == 'LogStructure_SBP.h':
-                    ret.append(os.path.join(root, f))
+        state_outside = 37
+        state_inside = 38
+        state = state_outside
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as fd:
+            text = fd.read()
+        if not _RE_LOGGER_WRITE_ANY.search(text):
+            # most files contain no logger.Write calls at all
+            return ret
+        for line in io.StringIO(text):
+            if state == state_outside:
+                # cheap check before trying the regular expressions:
+                stripped = line.lstrip()
+                if not (stripped.startswith("logger.Write") or
+                        stripped.startswith("AP::logger().Write")):
+                    continue
+                if (_RE_AP_LOGGER_WRITE_START.match(line) or
+                        _RE_LOGGER_WRITE_START.match(line)):
+                    state = state_inside
+                    line = _RE_COMMENT.sub("", line) # trim comments
+                    log_write_statement = [line]
+                continue
+            if state == state_inside:
+                line = _RE_COMMENT.sub("", line) # trim comments
+                # cpp-style string concatenation:
+                line = _RE_STR_CONCAT.sub('', line)
+                log_write_statement.append(line)
+                if _RE_STATEMENT_END.match(line):
+                    ret.append("".join(log_write_statement))
+                    state = state_outside
+        if state != state_outside:
+            raise NotAchievedException("Expected to be outside at end of file")
         return ret
 
-    def all_log_format_ids(self):
-        '''parse C++ code to extract definitions of log messages'''
-        structure_files = self.find_LogStructureFiles()
-        structure_lines = []
-        for f in structure_files:
-            structure_lines.extend(open(f).readlines())
-
-        defines = self.find_format_defines(structure_lines)
-
-        ids = {}
-        message_infos = []
-        for f in structure_files:
-            self.progress("structure file: %s" % f)
-            state_outside = 0
-            state_inside = 1
-            state = state_outside
-
-            linestate_none = 45
-            linestate_within = 46
-            linestate = linestate_none
-            debug = False
-            if f == "/home/pbarker/rc/ardupilot/libraries/AP_HAL_ChibiOS/LogStructure.h":
-                debug = True
-            for line in open(f).readlines():
-                if debug:
-                    print("line: %s" % line)
-                if isinstance(line, bytes):
-                    line = line.decode("utf-8")
-                line = re.sub("//.*", "", line) # trim comments
-                if re.match(r"\s*$", line):
+    def iter_log_cpp_message_infos(self, filepath):
+        '''yield the body of each entry in the LogStructure array in the
+        vehicle Log.cpp at filepath'''
+        state_outside = 67
+        state_inside = 68
+        state = state_outside
+        linestate_none = 89
+        linestate_within = 90
+        linestate = linestate_none
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as fd:
+            for line in fd:
+                idx = line.find("//")
+                if idx >= 0:
+                    line = line[:idx] # trim comments
+                if not line or line.isspace():
                     # blank line
                     continue
                 if state == state_outside:
-                    if ("#define LOG_COMMON_STRUCTURES" in line or
-                            re.match("#define LOG_STRUCTURE_FROM_.*", line) or
-                            re.match("#define LOG_RTC_MESSAGE.*", line)):
-                        if debug:
-                            self.progress("Moving inside")
+                    if ("const LogStructure" in line or
+                            "const struct LogStructure" in line):
                         state = state_inside
                     continue
                 if state == state_inside:
+                    if _RE_STRUCTURE_END.match(line):
+                        state = state_outside
+                        break
                     if linestate == linestate_none:
-                        allowed_list = [
-                            'LOG_STRUCTURE_FROM_',
-                            'LOG_RTC_MESSAGE',
-                        ]
-
-                        allowed = False
-                        for a in allowed_list:
-                            if a in line:
-                                allowed = True
-                        if allowed:
+                        if _RE_LOG_CPP_SKIP.search(line):
                             continue
-                        m = re.match(r"\s*{(.*)},\s*", line)
+                        m = _RE_OPEN_BRACE.match(line)
                         if m is not None:
                             # complete line
-                            if debug:
-                                print("Complete line: %s" % str(line))
-                            message_infos.append(m.group(1))
+                            # print("Complete line: %s" % str(line))
+                            yield m.group(1)
                             continue
-                        m = re.match(r"\s*{(.*)\\", line)
+                        m = _RE_OPEN_BRACE_PARTIAL.match(line)
                         if m is None:
-                            if debug:
-                                self.progress("Moving outside")
-                            state = state_outside
-                            continue
-                        partial_line = m.group(1)
-                        if debug:
-                            self.progress("partial line")
+                            raise NotAchievedException("Bad line %s" % line)
+                        partial_line = [m.group(1)]
                         linestate = linestate_within
                         continue
                     if linestate == linestate_within:
-                        if debug:
-                            self.progress("Looking for close-brace")
-                        m = re.match("(.*)}", line)
+                        m = _RE_CLOSE_BRACE.match(line)
                         if m is None:
-                            if debug:
-                                self.progress("no close-brace")
                             line = line.rstrip()
-                            newline = re.sub(r"\\$", "", line)
+                            newline = _RE_TRAIL_BACKSLASH.sub("", line)
                             if newline == line:
                                 raise NotAchievedException("Expected backslash at end of line")
                             line = newline
                             line = line.rstrip()
                             # cpp-style string concatenation:
-                            if debug:
-                                self.progress("more partial line")
-                            line = re.sub(r'"\s*"', '', line)
-                            partial_line += line
+                            line = _RE_STR_CONCAT.sub('', line)
+                            partial_line.append(line)
                             continue
-                        if debug:
-                            self.progress("found close-brace")
-                        message_infos.append(partial_line + m.group(1))
+                        partial_line.append(m.group(1))
+                        yield "".join(partial_line)
                         linestate = linestate_none
                         continue
                     raise NotAchievedException("Bad line (%s)")
 
-            if linestate != linestate_none:
-                raise NotAchievedException("Must be linestate-none at end of file")
+        if state == state_inside:
+            raise NotAchievedException("Should not be in state_inside at end")
 
-        # now look in the vehicle-specific logfile:
+    def all_log_format_ids(self):
+        '''parse C++ code to extract definitions of log messages'''
+        structure_files = self.find_LogStructureFiles()
+
+        defines = {}
+        ids = {}
+        message_infos = []
+        for f in structure_files:
+            self.progress("structure file: %s" % f)
+            with open(f, 'r', encoding='utf-8') as fd:
+                text = fd.read()
+            for m in _RE_DEFINE.finditer(text):
+                (a, b) = (m.group(1), m.group(2))
+                if a in defines:
+                    raise NotAchievedException("Duplicate define for (%s)" % a)
+                defines[a] = b
+            text = _RE_COMMENT.sub("", text) # trim comments
+            # each structure macro is joined into a single line, and
+            # each {...} initializer within it is a message definition:
+            for macro in _RE_STRUCTURE_MACRO.finditer(text):
+                body = _RE_LINE_CONTINUATION.sub("", macro.group(1))
+                # cpp-style string concatenation:
+                body = _RE_STR_CONCAT.sub('', body)
+                for m in _RE_STRUCTURE_ENTRY.finditer(body):
+                    message_infos.append(m.group(1))
+                # any brace left over belongs to a malformed entry,
+                # e.g. one missing a backslash continuation:
+                leftover = _RE_STRUCTURE_ENTRY.sub("", body)
+                if "{" in leftover or "}" in leftover:
+                    raise NotAchievedException("Malformed structure entry in %s (%s)" % (f, leftover.strip()))
+
+        # now look in the vehicle-specific logfile; its entries are
+        # consumed as they are parsed, as all defines are now known:
         filepath = os.path.join(self.vehicle_code_dirpath(), "Log.cpp")
-        state_outside = 67
-        state_inside = 68
-        state = state_outside
-        linestate_none = 89
-        linestate_within = 90
-        linestate = linestate_none
-        for line in open(filepath, 'rb').readlines():
-            if isinstance(line, bytes):
-                line = line.decode("utf-8")
-            line = re.sub("//.*", "", line) # trim comments
-            if re.match(r"\s*$", line):
-                # blank line
-                continue
-            if state == state_outside:
-                if ("const LogStructure" in line or
-                        "const struct LogStructure" in line):
-                    state = state_inside
-                continue
-            if state == state_inside:
-                if re.match("};", line):
-                    state = state_outside
-                    break
-                if linestate == linestate_none:
-                    if "#if HAL_QUADPLANE_ENABLED" in line:
-                        continue
-                    if "#if FRAME_CONFIG == HELI_FRAME" in line:
-                        continue
-                    if "#if AC_PRECLAND_ENABLED" in line:
-                        continue
-                    if "#if AP_PLANE_OFFBOARD_GUIDED_SLEW_ENABLED" in line:
-                        continue
-                    if "#end" in line:
-                        continue
-                    if "LOG_COMMON_STRUCTURES" in line:
-                        continue
-                    m = re.match(r"\s*{(.*)},\s*", line)
-                    if m is not None:
-                        # complete line
-                        # print("Complete line: %s" % str(line))
-                        message_infos.append(m.group(1))
-                        continue
-                    m = re.match(r"\s*{(.*)", line)
-                    if m is None:
-                        raise NotAchievedException("Bad line %s" % line)
-                    partial_line = m.group(1)
-                    linestate = linestate_within
-                    continue
-                if linestate == linestate_within:
-                    m = re.match("(.*)}", line)
-                    if m is None:
-                        line = line.rstrip()
-                        newline = re.sub(r"\\$", "", line)
-                        if newline == line:
-                            raise NotAchievedException("Expected backslash at end of line")
-                        line = newline
-                        line = line.rstrip()
-                        # cpp-style string concatenation:
-                        line = re.sub(r'"\s*"', '', line)
-                        partial_line += line
-                        continue
-                    message_infos.append(partial_line + m.group(1))
-                    linestate = linestate_none
-                    continue
-                raise NotAchievedException("Bad line (%s)")
 
-        if state == state_inside:
-            raise NotAchievedException("Should not be in state_inside at end")
+        # a single pass over each string substitutes every define; an
+        # empty alternation would match everywhere, so skip it if
+        # there are no defines:
+        defines_re = None
+        if len(defines):
+            defines_re = re.compile(r"\b(" + "|".join(re.escape(k) for k in defines) + r")\b")
 
-        for message_info in message_infos:
+        for message_info in itertools.chain(message_infos, self.iter_log_cpp_message_infos(filepath)):
             print("message_info: %s" % str(message_info))
-            for define in defines:
-                message_info = re.sub(define, defines[define], message_info)
-            m = re.match(r'\s*LOG_\w+\s*,\s*(?:sizeof|RLOG_SIZE)\([^)]+\)\s*,\s*"(\w+)"\s*,\s*"(\w+)"\s*,\s*"([\w,]+)"\s*,\s*"([^"]+)"\s*,\s*"([^"]+)"\s*(,\s*(true|false))?\s*$', message_info)  # noqa
+            if defines_re is not None:
+                message_info = defines_re.sub(lambda m: defines[m.group(1)], message_info)
+            m = _RE_LOG_MSG.match(message_info)
             if m is None:
                 print("NO MATCH")
                 continue
             (name, fmt, labels, units, multipliers) = (m.group(1), m.group(2), m.group(3), m.group(4), m.group(5))
             if name in ids:
                 raise NotAchievedException("Already seen a (%s) message" % name)
+            labels_list = labels.split(",")
             ids[name] = {
                 "name": name,
                 "format": fmt,
                 "labels": labels,
+                "labels_list": labels_list,
+                "labels_set": frozenset(labels_list),
                 "units": units,
                 "multipliers": multipliers,
             }
@@ -2879,67 +2901,34 @@ class TestSuite(abc.ABC):
         ]
         log_write_statements = []
         for base_directory in base_directories:
-            for root, dirs, files in os.walk(base_directory):
-                state_outside = 37
-                state_inside = 38
-                state = state_outside
-                for f in files:
-                    if not re.search("[.]cpp$", f):
-                        continue
-                    filepath = os.path.join(root, f)
-                    if "AP_Logger/examples" in filepath:
-                        # this is the sample file which contains examples...
-                        continue
-                    count = 0
-                    for line in open(filepath, 'rb').readlines():
-                        if isinstance(line, bytes):
-                            line = line.decode("utf-8")
-                        if state == state_outside:
-                            if (re.match(r"\s*AP::logger\(\)[.]Write(?:Streaming)?\(", line) or
-                                    re.match(r"\s*logger[.]Write(?:Streaming)?\(", line)):
-                                state = state_inside
-                                line = re.sub("//.*", "", line) # trim comments
-                                log_write_statement = line
-                            continue
-                        if state == state_inside:
-                            line = re.sub("//.*", "", line) # trim comments
-                            # cpp-style string concatenation:
-                            line = re.sub(r'"\s*"', '', line)
-                            log_write_statement += line
-                            if re.match(r".*\);", line):
-                                log_write_statements.append(log_write_statement)
-                                state = state_outside
-                        count += 1
-                    if state != state_outside:
-                        raise NotAchievedException("Expected to be outside at end of file")
-#                    print("%s has %u lines" % (f, count))
+            for filepath in _scan_cpp(base_directory):
+                log_write_statements.extend(self.find_log_write_statements(filepath))
         # change all whitespace to single space
-        log_write_statements = [re.sub(r"\s+", " ", x) for x in log_write_statements]
+        log_write_statements = [" ".join(x.split()) for x in log_write_statements]
 #        print("Got log-write-statements: %s" % str(log_write_statements))
-        results = []
         for log_write_statement in log_write_statements:
-            for define in defines:
-                log_write_statement = re.sub(define, defines[define], log_write_statement)
+            expanded = log_write_statement
+            if defines_re is not None:
+                expanded = defines_re.sub(lambda m: defines[m.group(1)], expanded)
             # fair warning: order is important here because of the
             # NKT/XKT special case below....
-            my_re = r' logger[.]Write(?:Streaming)?\(\s*"(\w+)"\s*,\s*"([\w,]+)".*\);'
-            m = re.match(my_re, log_write_statement)
+            my_re = _RE_LOGGER_WRITE
+            m = my_re.match(expanded)
             if m is None:
-                my_re = r' AP::logger\(\)[.]Write(?:Streaming)?\(\s*"(\w+)"\s*,\s*"([\w,]+)".*\);'
-                m = re.match(my_re, log_write_statement)
+                my_re = _RE_AP_LOGGER_WRITE
+                m = my_re.match(expanded)
             if m is None:
-                raise NotAchievedException("Did not match (%s) with (%s)" % (log_write_statement, str(my_re)))
-            else:
-                results.append((m.group(1), m.group(2)))
-
-        for result in results:
-            (name, labels) = result
+                raise NotAchievedException("Did not match (%s) with (%s)" % (expanded, my_re.pattern))
+            (name, labels) = (m.group(1), m.group(2))
             if name in ids:
                 raise Exception("Already have id for (%s)" % name)
 #            self.progress("Adding Log_Write result (%s)" % name)
+            labels_list = labels.split(",")
             ids[name] = {
                 "name": name,
                 "labels": labels,
+                "labels_list": labels_list,
+                "labels_set": frozenset(labels_list),
             }
 
         if len(ids) == 0:
@@ -2997,14 +2986,35 @@ class TestSuite(abc.ABC):
 
         return ret
 
+    def LoggerDocumentation_fingerprint(self, vehicle):
+        '''returns a digest of the paths and modification times of all
+        files parse.py reads when generating documentation for vehicle'''
+        h = hashlib.blake2b(digest_size=16)
+        h.update(vehicle.encode())
+        # walk exactly as parse.py does: nothing pruned, and following
+        # symlinked directories
+        paths = []
+        for dirpath in [self.vehicle_code_dirpath(), os.path.join(self.rootdir(), 'libraries')]:
+            paths.extend(_scan_files(dirpath,
+                                     lambda entry: entry.name.endswith((".cpp", ".h")),
+                                     skip_dirs=frozenset(),
+                                     follow_symlinks=True))
+        metadata_dirpath = os.path.join(self.rootdir(), 'Tools', 'autotest', 'logger_metadata')
+        paths.extend(_scan_files(metadata_dirpath,
+                                 lambda entry: entry.name.endswith(".py"),
+                                 skip_dirs=frozenset(),
+                                 follow_symlinks=True))
+        for path in sorted(paths):
+            st = os.stat(path)
+            h.update(path.encode())
+            h.update(str(st.st_mtime_ns).encode())
+        return h.hexdigest()
+
     def LoggerDocumentation(self):
         '''Test Onboard Logging Generation'''
         xml_filepath = os.path.join(self.buildlogs_dirpath(), "LogMessages.xml")
+        stamp_filepath = xml_filepath + ".stamp"
         parse_filepath = os.path.join(self.rootdir(), 'Tools', 'autotest', 'logger_metadata', 'parse.py')
-        try:
-            os.unlink(xml_filepath)
-        except OSError:
-            pass
         vehicle = self.log_name()
         if vehicle == 'BalanceBot':
             # same binary and parameters as Rover
@@ -3020,11 +3030,29 @@ class TestSuite(abc.ABC):
         }
         vehicle = vehicle_map[vehicle]
 
-        cmd = [parse_filepath, '--vehicle', vehicle]
-#        cmd.append("--verbose")
-        if util.run_cmd(cmd, directory=self.buildlogs_dirpath()) != 0:
-            self.progress("Failed parse.py (%s)" % vehicle)
-            return False
+        # only regenerate the XML if parse.py's inputs have changed
+        # since it was last generated for this vehicle:
+        fingerprint = self.LoggerDocumentation_fingerprint(vehicle)
+        try:
+            with open(stamp_filepath) as f:
+                up_to_date = f.read() == fingerprint and os.path.exists(xml_filepath)
+        except OSError:
+            up_to_date = False
+        if up_to_date:
+            self.progress("Reusing %s" % xml_filepath)
+        else:
+            for filepath in stamp_filepath, xml_filepath:
+                try:
+                    os.unlink(filepath)
+                except OSError:
+                    pass
+            cmd = [parse_filepath, '--vehicle', vehicle]
+#            cmd.append("--verbose")
+            if util.run_cmd(cmd, directory=self.buildlogs_dirpath()) != 0:
+                self.progress("Failed parse.py (%s)" % vehicle)
+                return False
+            with open(stamp_filepath, 'w') as f:
+                f.write(fingerprint)
         length = os.path.getsize(xml_filepath)
         min_length = 1024
         if length < min_length:
@@ -3032,29 +3060,26 @@ class TestSuite(abc.ABC):
                                        (length, min_length))
         self.progress("xml file length is %u" % length)
 
-        from lxml import objectify
-        xml = open(xml_filepath, 'rb').read()
-        objectify.enable_recursive_str()
-        tree = objectify.fromstring(xml)
+        from lxml import etree
 
         whitelist = self.LoggerDocumentation_whitelist()
 
         docco_ids = {}
-        for thing in tree.logformat:
-            name = str(thing.get("name"))
+        for _, thing in etree.iterparse(xml_filepath, events=("end",), tag="logformat"):
+            name = thing.get("name")
+            labels = [field.get("name") for field in thing.iterfind("fields/field")]
+            # discard the parsed element and any preceding siblings;
+            # we only need the names:
+            thing.clear()
+            while thing.getprevious() is not None:
+                del thing.getparent()[0]
             docco_ids[name] = {
                 "name": name,
-                "labels": [],
+                "labels": labels,
+                "labels_set": set(labels),
             }
-            if getattr(thing.fields, 'field', None) is None:
-                if name in whitelist:
-                    continue
+            if len(labels) == 0 and name not in whitelist:
                 raise NotAchievedException("no doc fields for %s" % name)
-            for field in thing.fields.field:
-                # print("field: (%s)" % str(field))
-                fieldname = field.get("name")
-#                print("Got (%s.%s)" % (name,str(fieldname)))
-                docco_ids[name]["labels"].append(fieldname)
 
         code_ids = self.all_log_format_ids()
         # self.progress("Code ids: (%s)" % str(sorted(code_ids.keys())))
@@ -3069,13 +3094,16 @@ class TestSuite(abc.ABC):
                 continue
             if name in whitelist:
                 overdocumented.add(name)
-            seen_labels = {}
-            for label in code_ids[name]["labels"].split(","):
-                if label in seen_labels:
-                    raise NotAchievedException("%s.%s is duplicate label" %
-                                               (name, label))
-                seen_labels[label] = True
-                if label not in docco_ids[name]["labels"]:
+            labels_list = code_ids[name]["labels_list"]
+            if len(labels_list) != len(code_ids[name]["labels_set"]):
+                seen_labels = set()
+                for label in labels_list:
+                    if label in seen_labels:
+                        raise NotAchievedException("%s.%s is duplicate label" %
+                                                   (name, label))
+                    seen_labels.add(label)
+            for label in labels_list:
+                if label not in docco_ids[name]["labels_set"]:
                     msg = ("%s.%s not in documented fields (have (%s))" %
                            (name, label, ",".join(docco_ids[name]["labels"])))
                     if name in whitelist:
@@ -3104,7 +3132,7 @@ class TestSuite(abc.ABC):
                 missing.append(name)
                 continue
             for label in docco_ids[name]["labels"]:
-                if label not in code_ids[name]["labels"].split(","):
+                if label not in code_ids[name]["labels_set"]:
                     # "name" was found in the XML, so was found in an
                     # @LoggerMessage markup line, but was *NOT* found
                     # in our bodgy parsing of the C++ code (in a